@@ -0,0 +1,60 @@
+import asyncio
+
+from database import Books, Reviews
+
+
+async def backfill_review_stats() -> None:
+    """
+    Recompute the review_count and rating_sum counters of every book from the reviews collection.
+    """
+
+    # Reviews are grouped per book, so no book ever holds its reviews in an array.
+    stats_pipeline = [
+        {
+            "$group": {
+                "_id": "$book_id",
+                "review_count": {"$sum": 1},
+                "rating_sum": {"$sum": "$rating"},
+            }
+        },
+        {
+            "$merge": {
+                "into": Books.name,
+                "on": "_id",
+                "whenMatched": "merge",
+                "whenNotMatched": "discard",
+            }
+        },
+    ]
+    await Reviews.aggregate(stats_pipeline).to_list(length=None)
+
+    # Books without reviews are not in the grouped output; the lookup stops at
+    # the first review, so it only tells whether a book has any.
+    no_reviews_pipeline = [
+        {
+            "$lookup": {
+                "from": Reviews.name,
+                "localField": "_id",
+                "foreignField": "book_id",
+                "pipeline": [{"$limit": 1}, {"$project": {"_id": 1}}],
+                "as": "reviews"
+            }
+        },
+        {"$match": {"reviews": {"$size": 0}}},
+        {"$project": {"review_count": {"$literal": 0}, "rating_sum": {"$literal": 0}}},
+        {
+            "$merge": {
+                "into": Books.name,
+                "on": "_id",
+                "whenMatched": "merge",
+                "whenNotMatched": "discard",
+            }
+        },
+    ]
+    await Books.aggregate(no_reviews_pipeline).to_list(length=None)
+
+    print("Book review stats recomputed.")
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill_review_stats())
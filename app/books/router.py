@@ -1,69 +1,174 @@
+import re
+from collections.abc import Mapping
 from typing import Annotated
 
 from bson import ObjectId
-from fastapi import APIRouter, status, HTTPException, Query, Path
+from bson.errors import InvalidId
+from fastapi import APIRouter, status, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
 from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
 
-from app.database import Books
-from app.books.schemas import BookBaseSchema, BookDetailSchema, BookBaseResponseSchema, BookDetailResponseSchema
+from app.database import Books, BooksRaw, Reviews, BOOKS_LIST_INDEX
+from app.dependencies import BookId
+from app.books.schemas import BookDetailSchema, BookBaseResponseSchema, BookDetailResponseSchema, BookListResponseSchema
+from app.cache import books_cache
 from app.config import settings
+from app.streaming import ListStream, stream_list_response
 
 router = APIRouter(prefix="/books", tags=["books"])
 
+# Responses are validated and dumped once through these adapters and returned
+# as ready response objects, so FastAPI does not validate them again.
+book_adapter = TypeAdapter(BookBaseResponseSchema)
+book_detail_adapter = TypeAdapter(BookDetailResponseSchema)
+
+# Number of books read from the cursor and written to the response at a time.
+STREAM_BATCH_SIZE = 100
+
+# Static pipeline stages, built once; handlers only allocate the stages that
+# depend on the request.
+BOOK_LIST_PROJECTION = {
+    "title": 1,
+    "authors.first_name": 1,
+    "authors.last_name": 1,
+    "published_date": 1,
+    "language": 1,
+    "genres": 1,
+}
+BOOK_LIST_PROJECT_STAGE = {"$project": BOOK_LIST_PROJECTION}
+BOOK_LIST_WITH_STATS_PROJECT_STAGE = {
+    "$project": {
+        **BOOK_LIST_PROJECTION,
+        "number_of_reviews": {"$ifNull": ["$review_count", 0]},
+        "average_rating": {
+            "$cond": [
+                {"$gt": ["$review_count", 0]},
+                {"$round": [{"$divide": ["$rating_sum", "$review_count"]}, 2]},
+                0,
+            ]
+        },
+    }
+}
+BOOK_ID_SORT_STAGE = {"$sort": {"_id": ASCENDING}}
+BOOK_TITLE_SORT_STAGE = {"$sort": {"title": ASCENDING}}
+TEXT_SCORE_SORT_STAGE = {"$sort": {"score": {"$meta": "textScore"}}}
+BOOK_REVIEW_STATS_STAGES = (
+    {"$lookup": {
+        "from": "reviews",
+        "let": {"book_id": "$_id"},
+        "pipeline": [
+            {"$match": {"$expr": {"$eq": ["$book_id", "$$book_id"]}}},
+            {"$group": {"_id": None, "count": {"$sum": 1}, "average": {"$avg": "$rating"}}},
+        ],
+        "as": "stats"
+    }},
+    {"$set": {
+        "number_of_reviews": {"$ifNull": [{"$first": "$stats.count"}, 0]},
+        "average_rating": {"$ifNull": [{"$round": [{"$first": "$stats.average"}, 2]}, 0]}
+    }},
+    {"$unset": "stats"},
+)
+
+
+async def set_review_stats(books: list[Mapping]) -> list[dict]:
+    """
+    Add number_of_reviews and average_rating to a page of books with a single grouped query on reviews
+    :param books: Books without review stats
+    :return: Books with review stats
+    """
+    stats_pipeline = [
+        {"$match": {"book_id": {"$in": [book["_id"] for book in books]}}},
+        {"$group": {"_id": "$book_id", "count": {"$sum": 1}, "average": {"$avg": "$rating"}}},
+    ]
+    stats = {item["_id"]: item async for item in Reviews.aggregate(stats_pipeline)}
+
+    books_with_stats = []
+    for book in books:
+        book_stats = stats.get(book["_id"])
+        books_with_stats.append({
+            **book,
+            "number_of_reviews": book_stats["count"] if book_stats else 0,
+            "average_rating": round(book_stats["average"], 2) if book_stats else 0,
+        })
+
+    return books_with_stats
+
+
+def dump_book(book: Mapping) -> bytes:
+    return book_adapter.dump_json(book_adapter.validate_python(book), by_alias=True)
+
 
 @router.get(
     "/",
     description="Get all books",
     summary="Get all books from the database",
-    response_description="List of books",
+    response_description="Page of books with a cursor to the next page",
     status_code=status.HTTP_200_OK,
-    response_model=list[BookBaseResponseSchema],
+    response_model=BookListResponseSchema,
+    response_class=ORJSONResponse,
 )
 async def get_all_books(
-    page: Annotated[int, Query(ge=1, title="Page number")] = 1,
+    request: Request,
+    after_id: Annotated[
+        str | None,
+        Query(title="Id of the last book from the previous page"),
+    ] = None,
+    page: Annotated[
+        int | None,
+        Query(ge=1, title="Page number", deprecated=True),
+    ] = None,
     limit: Annotated[
         int,
         Query(ge=1, le=500, title="Page size"),
     ] = settings.DEFAULT_PAGE_SIZE,
-) -> list[BookBaseResponseSchema]:
+) -> Response:
     """
     Get all books from the database
-    :param page: Page number
+    :param request: Request, used for If-None-Match
+    :param after_id: Id of the last book from the previous page
+    :param page: Page number, kept for old deep links; ignored if after_id is set
     :param limit: Page size
-    :return: List of books
+    :return: Page of books and a cursor to the next page
     """
+    if after_id is not None and not ObjectId.is_valid(after_id):
+        raise HTTPException(status_code=400, detail="Invalid after_id")
+
+    etag = books_cache.etag(after_id, page, limit)
+    if (cached_response := books_cache.response(request, etag)) is not None:
+        return cached_response
+
     try:
-        aggregation_pipeline = [
-            {"$sort": {"_id": ASCENDING}},
-            {"$skip": (page - 1) * limit},
-            {"$limit": limit},
-            {
-                "$lookup": {
-                    "from": "reviews",
-                    "localField": "_id",
-                    "foreignField": "book_id",
-                    "as": "reviews"
-                }
-            },
-            {
-                "$project": {
-                    "title": 1,
-                    "authors.first_name": 1,
-                    "authors.last_name": 1,
-                    "published_date": 1,
-                    "language": 1,
-                    "genres": 1,
-                    "number_of_reviews": {"$size": "$reviews"},
-                    "average_rating": {"$ifNull": [{"$round": [{"$avg": "$reviews.rating"}, 2]}, 0]}
-                }
-            },
-        ]
+        aggregation_pipeline = [BOOK_ID_SORT_STAGE]
 
-        books = await Books.aggregate(aggregation_pipeline).to_list(length=None)
-    except Exception as exc:
-        raise HTTPException(status_code=400, detail=str(exc))
+        if after_id is not None:
+            aggregation_pipeline.insert(0, {"$match": {"_id": {"$gt": ObjectId(after_id)}}})
+        elif page is not None:
+            aggregation_pipeline.append({"$skip": (page - 1) * limit})
 
-    return books
+        project_stage = (
+            BOOK_LIST_WITH_STATS_PROJECT_STAGE if settings.REVIEW_STATS_FROM_COUNTERS else BOOK_LIST_PROJECT_STAGE
+        )
+        aggregation_pipeline += [{"$limit": limit}, project_stage]
+
+        if settings.OPTIMIZE_PAGINATION_FOR_SPEED:
+            total = await Books.estimated_document_count()
+        else:
+            total = await Books.count_documents({})
+
+        cursor = BooksRaw.aggregate(aggregation_pipeline, hint=BOOKS_LIST_INDEX)
+        stream = ListStream(
+            cursor,
+            dump_book,
+            limit,
+            STREAM_BATCH_SIZE,
+            prepare=None if settings.REVIEW_STATS_FROM_COUNTERS else set_review_stats,
+        )
+
+        return await stream_list_response(stream, books_cache, etag, {"total": total})
+    except PyMongoError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
 
 @router.get(
@@ -73,40 +178,38 @@ async def get_all_books(
     response_description="Book data",
     status_code=status.HTTP_200_OK,
     response_model=BookDetailResponseSchema,
+    response_class=ORJSONResponse,
 )
 async def get_book_by_id(
-    book_id: Annotated[str, Path(title="Book id")],
-) -> BookDetailResponseSchema:
+    book_id: BookId,
+) -> ORJSONResponse:
     """
     Get a book from the database by id
     :param book_id: Book id
     :return: Book data
     """
     try:
-        book_id = ObjectId(book_id)
-        aggregation_pipeline = [
-            {"$match": {"_id": book_id}},
-            {"$lookup": {
-                "from": "reviews",
-                "localField": "_id",
-                "foreignField": "book_id",
-                "as": "reviews"
-            }},
-            {"$set": {
-                "number_of_reviews": {"$size": "$reviews"},
-                "average_rating": {"$ifNull": [{"$round": [{"$avg": "$reviews.rating"}, 2]}, 0]}
-            }},
-            {"$unset": "reviews"},
-        ]
+        if settings.REVIEW_STATS_FROM_COUNTERS:
+            book = await Books.find_one({"_id": book_id})
+        else:
+            aggregation_pipeline = [{"$match": {"_id": book_id}}, *BOOK_REVIEW_STATS_STAGES]
 
-        book = await Books.aggregate(aggregation_pipeline).to_list(length=None)
-    except Exception as exc:
+            books = await Books.aggregate(aggregation_pipeline).to_list(length=1)
+            book = books[0] if books else None
+    except PyMongoError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
 
-    if not book:
+    if book is None:
         raise HTTPException(status_code=404, detail="Book not found")
 
-    return book[0]
+    if settings.REVIEW_STATS_FROM_COUNTERS:
+        review_count = book.get("review_count", 0)
+        book["number_of_reviews"] = review_count
+        book["average_rating"] = round(book.get("rating_sum", 0) / review_count, 2) if review_count else 0
+
+    book = book_detail_adapter.validate_python(book)
+
+    return ORJSONResponse(content=book_detail_adapter.dump_python(book, mode="json", by_alias=True))
 
 
 @router.delete(
@@ -115,21 +218,21 @@ async def get_book_by_id(
     summary="Delete a book from the database by id",
     status_code=status.HTTP_204_NO_CONTENT,
 )
-async def delete_book_by_id(book_id: Annotated[str, Path(title="Book id")]) -> None:
+async def delete_book_by_id(book_id: BookId) -> None:
     """
     Delete a book from the database by id
     :param book_id: Book id
     """
     try:
-        book_id = ObjectId(book_id)
-
         result = await Books.delete_one({"_id": book_id})
-    except Exception as exc:
+    except PyMongoError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
 
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Book not found")
 
+    books_cache.invalidate()
+
 
 @router.post(
     "/",
@@ -144,13 +247,15 @@ async def create_book(book: BookDetailSchema) -> dict[str, str]:
     :return: Book id
     """
     try:
-        book_dict = book.dict(by_alias=True, exclude_unset=True)
+        book_dict = book.model_dump(by_alias=True, exclude_unset=True)
         if "_id" in book_dict:
             book_dict["_id"] = ObjectId(book_dict["_id"])
+        book_dict["review_count"] = 0
+        book_dict["rating_sum"] = 0
 
         result = await Books.insert_one(book_dict)
 
-    except Exception as exc:
+    except (PyMongoError, InvalidId) as exc:
         raise HTTPException(status_code=400, detail=str(exc))
 
     if not result.inserted_id:
@@ -158,6 +263,8 @@ async def create_book(book: BookDetailSchema) -> dict[str, str]:
             status_code=400, detail="Error occurred while creating a book"
         )
 
+    books_cache.invalidate()
+
     return {"book_id": str(result.inserted_id)}
 
 
@@ -168,7 +275,7 @@ async def create_book(book: BookDetailSchema) -> dict[str, str]:
     status_code=status.HTTP_204_NO_CONTENT,
 )
 async def update_book_by_id(
-    book_id: Annotated[str, Path(title="Book id")], book: BookDetailSchema
+    book_id: BookId, book: BookDetailSchema
 ) -> None:
     """
     Update a book in the database by id
@@ -176,20 +283,21 @@ async def update_book_by_id(
     :param book: Book data
     """
     try:
-        book_id = ObjectId(book_id)
-        book_dict = book.dict(by_alias=True, exclude_unset=True)
+        book_dict = book.model_dump(by_alias=True, exclude_unset=True)
 
         if "_id" in book_dict:
             del book_dict["_id"]
 
         result = await Books.update_one({"_id": book_id}, {"$set": book_dict})
 
-    except Exception as exc:
+    except PyMongoError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
 
-    if result.modified_count == 0:
+    if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Book not found")
 
+    books_cache.invalidate()
+
 
 @router.get(
     "/search/",
@@ -197,42 +305,42 @@ async def update_book_by_id(
     summary="Search books in the database",
     response_description="List of books",
     status_code=status.HTTP_200_OK,
-    response_model=list[BookBaseSchema],
+    response_model=list[BookBaseResponseSchema],
 )
 async def search_books(
-    query: Annotated[str, Query(title="Search query")],
-) -> list[BookBaseSchema]:
+    query: Annotated[str, Query(min_length=1, title="Search query")],
+) -> list[BookBaseResponseSchema]:
     """
-    Search books in the database using Atlas Search
+    Search books in the database by title, author or genre using the text index
     :param query: Search query string
     :return: List of books
     """
+    project_stage = (
+        BOOK_LIST_WITH_STATS_PROJECT_STAGE if settings.REVIEW_STATS_FROM_COUNTERS else BOOK_LIST_PROJECT_STAGE
+    )
+
     try:
         pipeline = [
-            {
-                "$search": {
-                    "index": "book-search",
-                    "wildcard": {
-                        "query": f"{query}",
-                        "path": {
-                            "wildcard": "*"
-                        },
-                        "allowAnalyzedField": True
-                    }
-                }
-            },
-            {
-                "$project": {
-                    "title": 1,
-                    "authors.first_name": 1,
-                    "authors.last_name": 1,
-                    "published_date": 1,
-                    "language": 1,
-                    "genres": 1,
-                }
-            }
+            {"$match": {"$text": {"$search": query}}},
+            TEXT_SCORE_SORT_STAGE,
+            {"$limit": settings.SEARCH_RESULTS_LIMIT},
+            project_stage,
         ]
         books = await Books.aggregate(pipeline).to_list(length=None)
-    except Exception as exc:
+
+        if not books:
+            # Text search only matches whole words, so fall back to a title
+            # prefix match, which is still served by the title index.
+            pipeline = [
+                {"$match": {"title": {"$regex": f"^{re.escape(query)}"}}},
+                BOOK_TITLE_SORT_STAGE,
+                {"$limit": settings.SEARCH_RESULTS_LIMIT},
+                project_stage,
+            ]
+            books = await Books.aggregate(pipeline).to_list(length=None)
+
+        if books and not settings.REVIEW_STATS_FROM_COUNTERS:
+            books = await set_review_stats(books)
+    except PyMongoError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
-    return books
\ No newline at end of file
+    return books
@@ -1,9 +1,11 @@
 from typing import Annotated
 
-from pydantic import BaseModel, Field, BeforeValidator, PositiveInt, PastDatetime, NonNegativeFloat, \
-    NonNegativeInt
+from pydantic import BaseModel, ConfigDict, Field, PlainValidator, WithJsonSchema, PositiveInt, PastDatetime, \
+    NonNegativeFloat, NonNegativeInt
 
-PyObjectId = Annotated[str, BeforeValidator(str)]
+# ObjectIds are converted with a single plain validator call instead of a
+# before-validator followed by a separate str validation step.
+PyObjectId = Annotated[str, PlainValidator(str), WithJsonSchema({"type": "string"})]
 
 
 class AuthorBaseSchema(BaseModel):
@@ -17,6 +19,8 @@ class AuthorDetailSchema(AuthorBaseSchema):
 
 
 class BookBaseSchema(BaseModel):
+    model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
+
     id: PyObjectId | None = Field(
         alias="_id", title="Book ID", exclude_none=True, default=None
     )
@@ -26,9 +30,6 @@ class BookBaseSchema(BaseModel):
     language: str = Field(title="Book language")
     genres: list[str] = Field(title="List of book genres")
 
-    class Config:
-        populate_by_name = True
-        arbitrary_types_allowed = True
 
 class BookBaseResponseSchema(BookBaseSchema):
     number_of_reviews: NonNegativeInt = Field(
@@ -39,6 +40,14 @@ class BookBaseResponseSchema(BookBaseSchema):
     )
 
 
+class BookListResponseSchema(BaseModel):
+    items: list[BookBaseResponseSchema] = Field(title="List of books")
+    next_cursor: PyObjectId | None = Field(
+        title="Id of the last book on the page, null on the last page", default=None
+    )
+    total: NonNegativeInt = Field(title="Total number of books")
+
+
 class BookDetailSchema(BookBaseSchema):
     authors: list[AuthorDetailSchema] = Field(title="List of book authors with details")
     edition: PositiveInt | None = Field(title="Book edition", default=None)
@@ -0,0 +1,97 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+from starlette import status
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.config import settings
+
+
+class ResponseCache:
+    """
+    Process-local LRU cache of serialized GET response bodies.
+
+    Entries are keyed by their ETag, which is derived from the request key, a
+    version bumped by every local write and the current TTL window. A write in
+    this process therefore retires all cached entries and ETags at once, while
+    writes made by other workers are picked up within one TTL window.
+
+    ETags describe the key, version and window, not the body. Handlers answer
+    304 only when the body is cached here, so a 304 never claims more than a
+    200 from this worker would. The cost is that clients get a full 200 again
+    each time the window rolls over, even if nothing changed.
+    """
+
+    def __init__(self, maxsize: int, ttl: int) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = 0
+        self.entries: OrderedDict[str, bytes] = OrderedDict()
+
+    def etag(self, *key: Hashable) -> str:
+        """
+        Build the ETag of a response
+        :param key: Values identifying the response, e.g. query parameters
+        :return: Quoted ETag
+        """
+        window = int(time.time() // self.ttl)
+        digest = hashlib.blake2b(
+            repr((self.version, window, key)).encode(), digest_size=16
+        ).hexdigest()
+        return f'"{digest}"'
+
+    def get(self, etag: str) -> bytes | None:
+        body = self.entries.get(etag)
+        if body is not None:
+            self.entries.move_to_end(etag)
+        return body
+
+    def set(self, etag: str, body: bytes) -> None:
+        self.entries[etag] = body
+        self.entries.move_to_end(etag)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def response(self, request: Request, etag: str) -> Response | None:
+        """
+        Answer a request from the cache
+        :param request: Incoming request
+        :param etag: ETag of the response
+        :return: 304 if the client already has the cached body, the body otherwise,
+            None if the body is not cached
+        """
+        body = self.get(etag)
+        if body is None:
+            return None
+
+        if is_not_modified(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+    def invalidate(self) -> None:
+        self.version += 1
+        self.entries.clear()
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """
+    Check whether the client already has the response with the given ETag
+    :param request: Incoming request
+    :param etag: Current ETag of the response
+    :return: True if the If-None-Match header matches the ETag
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+
+    return any(
+        tag.strip().removeprefix("W/") in (etag, "*") for tag in if_none_match.split(",")
+    )
+
+
+books_cache = ResponseCache(maxsize=settings.RESPONSE_CACHE_SIZE, ttl=settings.RESPONSE_CACHE_TTL)
+reviews_cache = ResponseCache(maxsize=settings.RESPONSE_CACHE_SIZE, ttl=settings.RESPONSE_CACHE_TTL)
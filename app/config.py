@@ -15,12 +15,38 @@ class CustomBaseSettings(BaseSettings):
 class Config(CustomBaseSettings):
     MONGODB_URL: str
     DATABASE_NAME: str
+    DB_POOL_SIZE: int = 32
+    # Connections opened up front so the first requests don't pay for the handshake
+    DB_MIN_POOL_SIZE: int = 8
+    # Connections a pool may be establishing at once, to avoid connection storms
+    DB_MAX_CONNECTING: int = 2
+    DB_WAIT_QUEUE_TIMEOUT_MS: int = 5000
+    DB_SERVER_SELECTION_TIMEOUT_MS: int = 5000
+    # Wire compression, in order of preference; zstd needs the zstandard package
+    DB_COMPRESSORS: str = "zstd,zlib"
 
     CORS_ORIGINS: list[str] = ["*"]
     CORS_ORIGINS_REGEX: str | None = None
     CORS_HEADERS: list[str] = ["*"]
 
     DEFAULT_PAGE_SIZE: int = 15
+    # Report list totals from collection metadata instead of counting documents
+    OPTIMIZE_PAGINATION_FOR_SPEED: bool = True
+    SEARCH_RESULTS_LIMIT: int = 50
+    # Read review stats from the counters stored on books instead of aggregating reviews
+    REVIEW_STATS_FROM_COUNTERS: bool = True
+    # Reviews page limits: at most this many reviews, and the page is cut short once
+    # the raw BSON read for it reaches the byte budget
+    REVIEWS_MAX_PAGE_SIZE: int = 100
+    REVIEWS_PAGE_MAX_BYTES: int = 1024 * 1024
+    # Maximum number of reviews accepted by one bulk create request
+    REVIEWS_BULK_MAX_SIZE: int = 1000
+
+    # In-process cache of GET responses; TTL also bounds staleness across workers
+    RESPONSE_CACHE_SIZE: int = 256
+    RESPONSE_CACHE_TTL: int = 10
+    # Streamed bodies larger than this are not cached, so a stream holds at most this much for the cache
+    RESPONSE_CACHE_MAX_BODY_SIZE: int = 1024 * 1024
 
 settings = Config()
 
@@ -1,11 +1,58 @@
 import motor.motor_asyncio
+from bson import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from pymongo import ASCENDING, TEXT, ReadPreference
 
 from app.config import settings
 
-client = motor.motor_asyncio.AsyncIOMotorClient(settings.MONGODB_URL)
+client = motor.motor_asyncio.AsyncIOMotorClient(
+    settings.MONGODB_URL,
+    maxPoolSize=settings.DB_POOL_SIZE,
+    minPoolSize=settings.DB_MIN_POOL_SIZE,
+    maxConnecting=settings.DB_MAX_CONNECTING,
+    waitQueueTimeoutMS=settings.DB_WAIT_QUEUE_TIMEOUT_MS,
+    serverSelectionTimeoutMS=settings.DB_SERVER_SELECTION_TIMEOUT_MS,
+    compressors=settings.DB_COMPRESSORS,
+)
 
 database = client[settings.DATABASE_NAME]
 
 Books = database["books"]
 
+# Read-only handle for list endpoints: documents stay as raw BSON and are only
+# decoded when the response schema reads them.
+BooksRaw = database.get_collection(
+    "books", codec_options=CodecOptions(document_class=RawBSONDocument)
+)
+
 Reviews = database["reviews"]
+
+# Read handle for review GETs: reviews tolerate a few seconds of staleness, so
+# reads go to a secondary when one is available and writes stay on the primary.
+# Documents stay as raw BSON, which also gives their size for free.
+ReviewsReadOnly = database.get_collection(
+    "reviews",
+    codec_options=CodecOptions(document_class=RawBSONDocument),
+    read_preference=ReadPreference.SECONDARY_PREFERRED,
+)
+
+BOOKS_LIST_INDEX = "_id_1_title_1_published_date_1_language_1"
+REVIEWS_LIST_INDEX = "book_id_1__id_1"
+
+
+async def create_indexes() -> None:
+    """
+    Create the indexes the API queries rely on. Safe to run on every startup.
+    """
+    await Books.create_index(
+        [("_id", ASCENDING), ("title", ASCENDING), ("published_date", ASCENDING), ("language", ASCENDING)],
+        name=BOOKS_LIST_INDEX,
+    )
+    await Books.create_index([("title", ASCENDING)])
+    await Books.create_index(
+        [("title", TEXT), ("authors.first_name", TEXT), ("authors.last_name", TEXT), ("genres", TEXT)]
+    )
+    # Serves the book_id joins and lookups and, with rating, covers the review stats aggregations.
+    await Reviews.create_index([("book_id", ASCENDING), ("rating", ASCENDING)])
+    # Equality on book_id plus _id order: serves the paginated reviews list without an in-memory sort.
+    await Reviews.create_index([("book_id", ASCENDING), ("_id", ASCENDING)], name=REVIEWS_LIST_INDEX)
@@ -0,0 +1,31 @@
+from typing import Annotated
+
+from bson import ObjectId
+from fastapi import Depends, HTTPException, Path
+
+
+def parse_object_id(value: str, name: str) -> ObjectId:
+    """
+    Convert a path parameter to an ObjectId
+    :param value: Raw parameter value
+    :param name: Parameter name used in the error message
+    :return: Parsed ObjectId
+    """
+    if not ObjectId.is_valid(value):
+        raise HTTPException(status_code=400, detail=f"Invalid {name}")
+
+    return ObjectId(value)
+
+
+# The dependencies are async so FastAPI calls them inline instead of
+# dispatching them to the threadpool.
+async def get_book_id(book_id: Annotated[str, Path(title="Book ID")]) -> ObjectId:
+    return parse_object_id(book_id, "book id")
+
+
+async def get_review_id(review_id: Annotated[str, Path(title="Review ID")]) -> ObjectId:
+    return parse_object_id(review_id, "review id")
+
+
+BookId = Annotated[ObjectId, Depends(get_book_id)]
+ReviewId = Annotated[ObjectId, Depends(get_review_id)]
@@ -6,23 +6,81 @@ from faker import Faker
 from motor.motor_asyncio import AsyncIOMotorCollection
 
 from database import Books, Reviews
+from backfill_review_stats import backfill_review_stats
+
+
+NATIONALITIES = [
+    "American",
+    "British",
+    "French",
+    "German",
+    "Spanish",
+    "Chinese",
+    "Japanese",
+    "Ukrainian",
+    "Italian",
+    "Portuguese",
+]
+
+LANGUAGES = [
+    "English",
+    "Spanish",
+    "French",
+    "German",
+    "Chinese",
+    "Japanese",
+    "Ukrainian",
+    "Italian",
+    "Portuguese",
+]
+
+GENRES = [
+    "Fiction",
+    "Non-Fiction",
+    "Mystery",
+    "Science Fiction",
+    "Fantasy",
+    "Romance",
+    "Thriller",
+    "Horror",
+    "Biography",
+    "Self-Help",
+    "History",
+    "Poetry",
+]
+
+INSERT_BATCH_SIZE = 10000
 
 
-def generate_books_data(quantity: int = 100) -> list[dict]:
+def generate_books_data(quantity: int = 100, seed: int | None = None) -> list[dict]:
     """
     Generate fake data for books.
     :param quantity: Number of books to generate.
+    :param seed: Seed for reproducible data.
     :return: List of dictionaries with fake data.
     """
 
     fake = Faker()
+    fake.seed_instance(seed)
+    rng = random.Random(seed)
+
+    # Categorical and numeric fields are drawn for all books at once;
+    # Faker is only used for the free-text fields.
+    title_lengths = rng.choices(range(2, 7), k=quantity)
+    editions = rng.choices(range(1, 11), k=quantity)
+    author_counts = rng.choices(range(1, 4), k=quantity)
+    pages = rng.choices(range(100, 801), k=quantity)
+    languages = rng.choices(LANGUAGES, k=quantity)
+    genre_counts = rng.choices(range(1, 6), k=quantity)
+    nationalities = iter(rng.choices(NATIONALITIES, k=sum(author_counts)))
+
     books = []
-    for _ in range(quantity):
+    for i in range(quantity):
         book = {
             "title": fake.sentence(
-                nb_words=random.randint(2, 6), variable_nb_words=True
+                nb_words=title_lengths[i], variable_nb_words=True
             ).title()[:-1],
-            "edition": random.randint(1, 10),
+            "edition": editions[i],
             "authors": [
                 {
                     "first_name": fake.first_name(),
@@ -31,85 +89,51 @@ def generate_books_data(quantity: int = 100) -> list[dict]:
                         fake.date_of_birth(minimum_age=16, maximum_age=100),
                         datetime.min.time(),
                     ),
-                    "nationality": random.choice(
-                        [
-                            "American",
-                            "British",
-                            "French",
-                            "German",
-                            "Spanish",
-                            "Chinese",
-                            "Japanese",
-                            "Ukrainian",
-                            "Italian",
-                            "Portuguese",
-                        ]
-                    ),
+                    "nationality": next(nationalities),
                 }
-                for _ in range(random.randint(1, 3))
+                for _ in range(author_counts[i])
             ],
             "published_date": datetime.combine(
                 fake.date_between(start_date="-80y", end_date="today"),
                 datetime.min.time(),
             ),
             "isbn": fake.isbn13(),
-            "pages": random.randint(100, 800),
+            "pages": pages[i],
             "cover_image": fake.image_url(),
-            "language": random.choice(
-                [
-                    "English",
-                    "Spanish",
-                    "French",
-                    "German",
-                    "Chinese",
-                    "Japanese",
-                    "Ukrainian",
-                    "Italian",
-                    "Portuguese",
-                ]
-            ),
+            "language": languages[i],
             "publisher": fake.company(),
-            "genres": random.sample(
-                [
-                    "Fiction",
-                    "Non-Fiction",
-                    "Mystery",
-                    "Science Fiction",
-                    "Fantasy",
-                    "Romance",
-                    "Thriller",
-                    "Horror",
-                    "Biography",
-                    "Self-Help",
-                    "History",
-                    "Poetry",
-                ],
-                random.randint(1, 5),
-            ),
+            "genres": rng.sample(GENRES, genre_counts[i]),
             "summary": fake.paragraph(nb_sentences=5),
         }
         books.append(book)
     return books
 
 
-def generate_reviews_data(book_ids: list, quantity: int = 1000) -> list[dict]:
+def generate_reviews_data(book_ids: list, quantity: int = 1000, seed: int | None = None) -> list[dict]:
     """
     Generate fake data for reviews.
     :param book_ids: List of books ids.
     :param quantity: Number of reviews to generate.
+    :param seed: Seed for reproducible data.
     :return: List of dictionaries with fake data.
     """
 
     fake = Faker()
+    fake.seed_instance(seed)
+    rng = random.Random(seed)
+
+    reviews_book_ids = rng.choices(book_ids, k=quantity)
+    ratings = rng.choices(range(1, 11), k=quantity)
+
     reviews = []
-    for _ in range(quantity):
+    for i in range(quantity):
         review = {
-            "book_id": random.choice(book_ids),
+            "book_id": reviews_book_ids[i],
             "reviewer": {
                 "first_name": fake.first_name(),
                 "last_name": fake.last_name(),
             },
-            "rating": random.randint(1, 10),
+            "rating": ratings[i],
             "comment": fake.paragraph(nb_sentences=3),
             "review_date": fake.date_time_this_year(),
         }
@@ -121,17 +145,23 @@ async def load_data_to_database(
     data: list[dict], collection: AsyncIOMotorCollection
 ) -> None:
     """
-    Load data to MongoDB database.
+    Load data to MongoDB database in unordered batches.
     :param data: List of dictionaries with data to load.
     :param collection: Collection to load data to.
     """
-    try:
-        result = await collection.insert_many(data)
-    except Exception as e:
-        print(f"Error occurred while loading data to database: {e}")
-        return
+    inserted = 0
+    for start in range(0, len(data), INSERT_BATCH_SIZE):
+        try:
+            result = await collection.insert_many(
+                data[start:start + INSERT_BATCH_SIZE], ordered=False
+            )
+        except Exception as e:
+            print(f"Error occurred while loading data to database: {e}")
+            return
 
-    print(f"Data loaded to database. Inserted {len(result.inserted_ids)} documents.")
+        inserted += len(result.inserted_ids)
+
+    print(f"Data loaded to database. Inserted {inserted} documents.")
 
 
 async def get_all_books_ids() -> list:
@@ -164,6 +194,8 @@ async def fill_database(book_quantity: int = 100, review_quantity: int = 10000)
 
     await load_data_to_database(reviews_data, Reviews)
 
+    await backfill_review_stats()
+
     print("Database filled with fake data.")
 
 
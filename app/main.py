@@ -3,12 +3,15 @@ from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.responses import JSONResponse
 from fastapi import FastAPI, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 
 from app.books.router import router as books_router
 from app.reviews.router import router as reviews_router
 from app.config import app_configs, settings
+from app.database import create_indexes
 
-app = FastAPI(**app_configs)
+app = FastAPI(**app_configs, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,6 +22,13 @@ app.add_middleware(
     allow_headers=settings.CORS_HEADERS,
 )
 
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+
+@app.on_event("startup")
+async def startup() -> None:
+    await create_indexes()
+
 
 @app.exception_handler(StarletteHTTPException)
 async def http_exception_handler(request, exc):
@@ -1,53 +1,151 @@
-from typing import Annotated
+from collections.abc import Mapping
+from typing import Annotated, Literal
 
 from bson import ObjectId
-from fastapi import APIRouter, status, Path, HTTPException, Query
-
-from app.database import Reviews
-from app.reviews.schemas import ReviewBaseSchema
+from fastapi import APIRouter, status, Body, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from app.cache import books_cache, reviews_cache
+from app.database import Books, Reviews, ReviewsReadOnly, REVIEWS_LIST_INDEX
+from app.dependencies import BookId, ReviewId
+from app.reviews.schemas import ReviewCreateSchema, ReviewUpdateSchema, ReviewResponseSchema, \
+    ReviewPartialResponseSchema, ReviewListResponseSchema
 from app.config import settings
+from app.streaming import ListStream, stream_list_response
 
 router = APIRouter(prefix="/books/{book_id}/reviews", tags=["reviews"])
 
+review_adapter = TypeAdapter(ReviewResponseSchema)
+review_partial_adapter = TypeAdapter(ReviewPartialResponseSchema)
+
+# Number of reviews read from the cursor and written to the response at a time;
+# also the driver batch size, so no more than this is fetched ahead of the response.
+# A default-sized page fits in one batch and is sent with its ETag.
+STREAM_BATCH_SIZE = 20
+
+REVIEW_PROJECTION = {
+    "_id": 1,
+    "book_id": 1,
+    "rating": 1,
+    "comment": 1,
+    "reviewer": 1,
+    "review_date": 1,
+}
+# Fields a client may request through the fields query parameter.
+ReviewField = Literal["book_id", "rating", "comment", "reviewer", "review_date"]
+
+
+async def update_book_review_stats(book_id: ObjectId, count_delta: int, rating_delta: float) -> None:
+    """
+    Keep the review counters stored on the book in sync with its reviews
+    :param book_id: Book ID
+    :param count_delta: Change in the number of reviews
+    :param rating_delta: Change in the sum of ratings
+    """
+    await Books.update_one(
+        {"_id": book_id},
+        {"$inc": {"review_count": count_delta, "rating_sum": rating_delta}},
+    )
+    books_cache.invalidate()
+
+
+def dump_review(review: Mapping) -> bytes:
+    return review_adapter.dump_json(review_adapter.validate_python(review), by_alias=True)
+
 
 @router.get(
     "/",
     description="Get all reviews for a book",
     summary="Get all reviews for a book from the database",
-    response_description="List of reviews",
+    response_description="Page of reviews with a cursor to the next page",
     status_code=status.HTTP_200_OK,
-    response_model=list[ReviewBaseSchema],
+    response_model=ReviewListResponseSchema,
+    response_class=ORJSONResponse,
 )
 async def get_all_reviews(
-    book_id: Annotated[str, Path(title="Book ID")],
-    page: Annotated[int, Query(ge=1, title="Page number")] = 1,
+    request: Request,
+    book_id: BookId,
+    after_id: Annotated[
+        str | None,
+        Query(title="Id of the last review from the previous page"),
+    ] = None,
+    page: Annotated[
+        int | None,
+        Query(ge=1, title="Page number", deprecated=True),
+    ] = None,
     limit: Annotated[
         int,
-        Query(ge=1, le=500, title="Page size"),
+        Query(ge=1, le=settings.REVIEWS_MAX_PAGE_SIZE, title="Page size"),
     ] = settings.DEFAULT_PAGE_SIZE,
-) -> list[ReviewBaseSchema]:
+) -> Response:
     """
     Get all reviews for a book from the database
+    :param request: Request, used for If-None-Match
     :param book_id: Book ID
-    :param page: Page number
-    :param limit: Page size
-    :return: List of reviews
+    :param after_id: Id of the last review from the previous page
+    :param page: Page number, kept for old deep links; ignored if after_id is set
+    :param limit: Page size; with after_id pages may hold fewer reviews when they are large
+    :return: Page of reviews and a cursor to the next page
+
+    Pages read with after_id stop early once they hold REVIEWS_PAGE_MAX_BYTES of reviews.
+    Pages read by number always hold limit reviews, as the offset of page N assumes
+    every earlier page was full.
+
+    No count query is run here; the number of reviews is served by the separate count endpoint.
     """
 
-    try:
-        book_id = ObjectId(book_id)
-
-        reviews = (
-            await Reviews.find({"book_id": book_id})
-            .sort("_id")
-            .skip((page - 1) * limit)
-            .limit(limit)
-            .to_list(length=None)
-        )
-    except Exception as exc:
-        raise HTTPException(status_code=400, detail=str(exc))
+    if after_id is not None and not ObjectId.is_valid(after_id):
+        raise HTTPException(status_code=400, detail="Invalid after_id")
+
+    etag = reviews_cache.etag(book_id, after_id, page, limit)
+    if (cached_response := reviews_cache.response(request, etag)) is not None:
+        return cached_response
+
+    query = {"book_id": book_id}
+    if after_id is not None:
+        query["_id"] = {"$gt": ObjectId(after_id)}
 
-    return reviews
+    cursor = ReviewsReadOnly.find(query, projection=REVIEW_PROJECTION).sort("_id").hint(REVIEWS_LIST_INDEX)
+    max_bytes = settings.REVIEWS_PAGE_MAX_BYTES
+    if after_id is None and page is not None:
+        cursor = cursor.skip((page - 1) * limit)
+        max_bytes = None
+
+    cursor = cursor.limit(limit).batch_size(STREAM_BATCH_SIZE)
+    stream = ListStream(cursor, dump_review, limit, STREAM_BATCH_SIZE, max_bytes=max_bytes)
+
+    return await stream_list_response(stream, reviews_cache, etag)
+
+
+@router.get(
+    "/count",
+    description="Get the number of reviews for a book",
+    summary="Get the number of reviews for a book",
+    response_description="Number of reviews",
+    status_code=status.HTTP_200_OK,
+)
+async def get_reviews_count(
+    book_id: BookId,
+) -> dict[str, int]:
+    """
+    Get the number of reviews for a book, read from the book's review counter
+    :param book_id: Book ID
+    :return: Number of reviews
+    """
+
+    book = await Books.find_one({"_id": book_id}, projection={"review_count": 1})
+    if book is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+
+    if settings.REVIEW_STATS_FROM_COUNTERS:
+        count = book.get("review_count", 0)
+    else:
+        count = await Reviews.count_documents({"book_id": book_id})
+
+    return {"count": count}
 
 
 @router.get(
@@ -56,31 +154,48 @@ async def get_all_reviews(
     summary="Get a review by id from the database",
     response_description="Review data",
     status_code=status.HTTP_200_OK,
-    response_model=ReviewBaseSchema,
+    response_model=ReviewResponseSchema,
+    response_class=ORJSONResponse,
 )
 async def get_review_by_id(
-    book_id: Annotated[str, Path(title="Book ID")],
-    review_id: Annotated[str, Path(title="Review ID")],
-) -> ReviewBaseSchema:
+    request: Request,
+    book_id: BookId,
+    review_id: ReviewId,
+    fields: Annotated[
+        list[ReviewField] | None,
+        Query(title="Fields to return, all fields if omitted"),
+    ] = None,
+) -> Response:
     """
     Get a review by id from the database
+    :param request: Request, used for If-None-Match
     :param book_id: Book ID
     :param review_id: Review ID
+    :param fields: Fields to return; _id is always included
     :return: Review data
     """
 
-    try:
-        book_id = ObjectId(book_id)
-        review_id = ObjectId(review_id)
+    fields = sorted(set(fields)) if fields else None
 
-        review = await Reviews.find_one({"_id": review_id, "book_id": book_id})
-    except Exception as exc:
-        raise HTTPException(status_code=400, detail=str(exc))
+    etag = reviews_cache.etag(book_id, review_id, fields)
+    if (cached_response := reviews_cache.response(request, etag)) is not None:
+        return cached_response
+
+    projection = dict.fromkeys(fields, 1) if fields else REVIEW_PROJECTION
+    review = await ReviewsReadOnly.find_one({"_id": review_id, "book_id": book_id}, projection=projection)
 
     if review is None:
         raise HTTPException(status_code=404, detail="Review not found")
 
-    return review
+    if fields:
+        body = review_partial_adapter.dump_json(
+            review_partial_adapter.validate_python(review), by_alias=True, exclude_unset=True
+        )
+    else:
+        body = dump_review(review)
+    reviews_cache.set(etag, body)
+
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 
 @router.delete(
@@ -90,8 +205,8 @@ async def get_review_by_id(
     status_code=status.HTTP_204_NO_CONTENT,
 )
 async def delete_review_by_id(
-    book_id: Annotated[str, Path(title="Book ID")],
-    review_id: Annotated[str, Path(title="Review ID")],
+    book_id: BookId,
+    review_id: ReviewId,
 ) -> None:
     """
     Delete a review by id from the database
@@ -99,17 +214,16 @@ async def delete_review_by_id(
     :param review_id: Review ID
     """
 
-    try:
-        book_id = ObjectId(book_id)
-        review_id = ObjectId(review_id)
-
-        result = await Reviews.delete_one({"_id": review_id, "book_id": book_id})
-    except Exception as exc:
-        raise HTTPException(status_code=400, detail=str(exc))
+    review = await Reviews.find_one_and_delete(
+        {"_id": review_id, "book_id": book_id}, projection={"rating": 1}
+    )
 
-    if result.deleted_count == 0:
+    if review is None:
         raise HTTPException(status_code=404, detail="Review not found")
 
+    reviews_cache.invalidate()
+    await update_book_review_stats(book_id, -1, -review["rating"])
+
 
 @router.post(
     "/",
@@ -118,7 +232,7 @@ async def delete_review_by_id(
     status_code=status.HTTP_201_CREATED,
 )
 async def create_review(
-    book_id: Annotated[str, Path(title="Book ID")], review: ReviewBaseSchema
+    book_id: BookId, review: ReviewCreateSchema
 ) -> dict[str, str]:
     """
     Create a review for a book in the database
@@ -127,26 +241,67 @@ async def create_review(
     :return: Created review ID
     """
 
-    try:
-        book_id = ObjectId(book_id)
-
-        review_data = review.dict(exclude_unset=True, by_alias=True)
-        review_data["book_id"] = book_id
-
-        if "_id" in review_data:
-            review_data["_id"] = ObjectId(review_data["_id"])
+    review_data = review.model_dump(by_alias=True, exclude_unset=True)
+    review_data["book_id"] = book_id
 
-        result = await Reviews.insert_one(review_data)
-    except Exception as exc:
-        raise HTTPException(status_code=400, detail=str(exc))
+    result = await Reviews.insert_one(review_data)
 
     if not result.inserted_id:
         raise HTTPException(
             status_code=400, detail="Error occurred while creating a review"
         )
 
+    reviews_cache.invalidate()
+    await update_book_review_stats(book_id, 1, review_data["rating"])
+
     return {"review_id": str(result.inserted_id)}
 
+
+@router.post(
+    "/bulk",
+    description="Create reviews in bulk",
+    summary="Create several reviews for a book in the database in one request",
+    status_code=status.HTTP_201_CREATED,
+)
+async def create_reviews(
+    book_id: BookId,
+    reviews: Annotated[
+        list[ReviewCreateSchema],
+        Body(min_length=1, max_length=settings.REVIEWS_BULK_MAX_SIZE),
+    ],
+) -> dict[str, list]:
+    """
+    Create several reviews for a book in the database with a single unordered insert
+    :param book_id: Book ID
+    :param reviews: Reviews data
+    :return: Created review IDs and positions of the reviews that failed to insert
+    """
+
+    reviews_data = [review.model_dump(by_alias=True, exclude_unset=True) for review in reviews]
+    for review_data in reviews_data:
+        review_data["book_id"] = book_id
+
+    # An unordered insert keeps going past failed documents, so the reviews
+    # that did get in still have to be counted on the book.
+    failed = set()
+    try:
+        await Reviews.insert_many(reviews_data, ordered=False)
+    except BulkWriteError as exc:
+        failed = {error["index"] for error in exc.details["writeErrors"]}
+
+    inserted = [review_data for i, review_data in enumerate(reviews_data) if i not in failed]
+
+    if inserted:
+        reviews_cache.invalidate()
+        await update_book_review_stats(
+            book_id, len(inserted), sum(review_data["rating"] for review_data in inserted)
+        )
+
+    return {
+        "review_ids": [str(review_data["_id"]) for review_data in inserted],
+        "failed": sorted(failed),
+    }
+
 @router.put(
     "/{review_id}",
     description="Update a review",
@@ -154,33 +309,33 @@ async def create_review(
     status_code=status.HTTP_204_NO_CONTENT,
 )
 async def update_review(
-    book_id: Annotated[str, Path(title="Book ID")],
-    review_id: Annotated[str, Path(title="Review ID")],
-    review: ReviewBaseSchema,
+    book_id: BookId,
+    review_id: ReviewId,
+    review: ReviewUpdateSchema,
 ) -> None:
     """
     Update a review for a book in the database
     :param book_id: Book ID
     :param review_id: Review ID
-    :param review: Review data
+    :param review: Review fields to change
     """
 
-    try:
-        book_id = ObjectId(book_id)
-        review_id = ObjectId(review_id)
-
-        review_data = review.dict(exclude_unset=True, by_alias=True)
-
-        if "_id" in review_data:
-            del review_data["_id"]
-        if "book_id" in review_data:
-            del review_data["book_id"]
+    review_data = review.model_dump(by_alias=True, exclude_unset=True, exclude_none=True)
+    if not review_data:
+        raise HTTPException(status_code=400, detail="No review fields to update")
 
-        result = await Reviews.update_one(
-            {"_id": review_id, "book_id": book_id}, {"$set": review_data}
-        )
-    except Exception as exc:
-        raise HTTPException(status_code=400, detail=str(exc))
+    # One round-trip both applies the update and tells whether the review exists;
+    # the previous rating is needed to adjust the book's rating_sum.
+    old_review = await Reviews.find_one_and_update(
+        {"_id": review_id, "book_id": book_id},
+        {"$set": review_data},
+        projection={"rating": 1},
+        return_document=ReturnDocument.BEFORE,
+    )
 
-    if result.modified_count == 0:
+    if old_review is None:
         raise HTTPException(status_code=404, detail="Review not found")
+
+    reviews_cache.invalidate()
+    if "rating" in review_data and review_data["rating"] != old_review["rating"]:
+        await update_book_review_stats(book_id, 0, review_data["rating"] - old_review["rating"])
@@ -1,4 +1,4 @@
-from pydantic import Field, BaseModel, PastDatetime
+from pydantic import Field, BaseModel, ConfigDict, PastDatetime
 
 from app.books.schemas import PyObjectId
 
@@ -9,11 +9,39 @@ class ReviewerBaseSchema(BaseModel):
 
 
 class ReviewBaseSchema(BaseModel):
-    id: PyObjectId | None = Field(
-        alias="_id", title="Review ID", exclude_none=True, default=None
-    )
-    book_id: PyObjectId = Field(title="Book ID")
+    model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
+
     rating: int = Field(title="Review rating", ge=1, le=10)
     comment: str = Field(title="Review comment")
     reviewer: ReviewerBaseSchema = Field(title="Reviewer data")
     review_date: PastDatetime = Field(title="Review date")
+
+
+class ReviewCreateSchema(ReviewBaseSchema):
+    pass
+
+
+class ReviewUpdateSchema(BaseModel):
+    rating: int | None = Field(title="Review rating", ge=1, le=10, default=None)
+    comment: str | None = Field(title="Review comment", default=None)
+    reviewer: ReviewerBaseSchema | None = Field(title="Reviewer data", default=None)
+    review_date: PastDatetime | None = Field(title="Review date", default=None)
+
+
+class ReviewResponseSchema(ReviewBaseSchema):
+    id: PyObjectId | None = Field(
+        alias="_id", title="Review ID", exclude_none=True, default=None
+    )
+    book_id: PyObjectId = Field(title="Book ID")
+
+
+class ReviewPartialResponseSchema(ReviewUpdateSchema):
+    id: PyObjectId | None = Field(alias="_id", title="Review ID", default=None)
+    book_id: PyObjectId | None = Field(title="Book ID", default=None)
+
+
+class ReviewListResponseSchema(BaseModel):
+    items: list[ReviewResponseSchema] = Field(title="List of reviews")
+    next_cursor: PyObjectId | None = Field(
+        title="Id of the last review on the page, null on the last page", default=None
+    )
@@ -0,0 +1,166 @@
+from collections.abc import AsyncIterator, Awaitable, Callable, Mapping
+from typing import Any
+
+import orjson
+from fastapi.responses import StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorCommandCursor, AsyncIOMotorCursor
+
+from app.cache import ResponseCache
+from app.config import settings
+
+
+class ListStream:
+    """
+    Page of documents read from a cursor one batch at a time and serialized for
+    a {"items": [...], "next_cursor": ...} list response.
+    """
+
+    def __init__(
+        self,
+        cursor: AsyncIOMotorCursor | AsyncIOMotorCommandCursor,
+        serialize: Callable[[Mapping], bytes],
+        limit: int,
+        batch_size: int,
+        prepare: Callable[[list[Mapping]], Awaitable[list[Mapping]]] | None = None,
+        max_bytes: int | None = None,
+    ) -> None:
+        """
+        :param cursor: Cursor over the page, already limited to the page size
+        :param serialize: Validates and dumps one document to JSON
+        :param limit: Page size
+        :param batch_size: Number of documents read from the cursor at a time
+        :param prepare: Adds data to each batch before it is serialized
+        :param max_bytes: Raw BSON bytes after which the page stops early, None for no budget;
+            documents must be RawBSONDocument when it is set, and are then pulled from the
+            cursor one at a time so no document is read past the budget
+        """
+        self.cursor = cursor
+        self.serialize = serialize
+        self.limit = limit
+        self.batch_size = batch_size
+        self.prepare = prepare
+        self.max_bytes = max_bytes
+        self.count = 0
+        self.size = 0
+        self.last_id = None
+        self.is_cut_short = False
+        self.is_done = False
+
+    async def read_batch(self) -> list[bytes]:
+        """
+        Read and serialize the next batch of documents
+        :return: Serialized documents, empty once the page is complete
+        """
+        if self.is_done:
+            return []
+
+        if self.max_bytes is None:
+            documents = await self.cursor.to_list(length=self.batch_size)
+        else:
+            documents = await self.read_within_budget()
+
+        if documents and self.prepare is not None:
+            documents = await self.prepare(documents)
+
+        items = []
+        for document in documents:
+            items.append(self.serialize(document))
+            self.count += 1
+            self.last_id = document["_id"]
+
+        self.is_done = self.is_cut_short or len(documents) < self.batch_size or self.count >= self.limit
+        return items
+
+    async def read_within_budget(self) -> list[Mapping]:
+        """
+        Read up to a batch of documents one at a time, stopping as soon as the byte budget is spent
+        :return: Documents
+        """
+        documents = []
+        while len(documents) < self.batch_size:
+            document = await anext(self.cursor, None)
+            if document is None:
+                break
+
+            documents.append(document)
+            self.size += len(document.raw)
+            if self.size >= self.max_bytes:
+                self.is_cut_short = True
+                await self.cursor.close()
+                break
+
+        return documents
+
+    @property
+    def next_cursor(self) -> str | None:
+        # A page cut short by the byte budget still has a next page.
+        is_full = self.count == self.limit or self.is_cut_short
+        return str(self.last_id) if is_full else None
+
+
+async def stream_list_response(
+    stream: ListStream, cache: ResponseCache, etag: str, extra: dict[str, Any] | None = None
+) -> StreamingResponse:
+    """
+    Start a streamed list response and cache the body once it is complete
+    :param stream: Page to stream
+    :param cache: Cache to store the body in
+    :param etag: ETag of the response
+    :param extra: Fields added to the list document after next_cursor
+    :return: Streaming response
+
+    The first batch is read and serialized before the response starts, so database
+    and validation errors reach the handler while an error status can still be sent.
+    The ETag is only sent when that batch is the whole page; a longer page could
+    still fail mid-stream, and its complete body gets the ETag from the cache.
+
+    Besides the current batch, the stream holds the body written so far for the
+    cache, up to RESPONSE_CACHE_MAX_BODY_SIZE; larger bodies are not cached.
+    """
+    items = await stream.read_batch()
+
+    return StreamingResponse(
+        stream_list_body(stream, items, cache, etag, extra or {}),
+        media_type="application/json",
+        headers={"ETag": etag} if stream.is_done else None,
+    )
+
+
+async def stream_list_body(
+    stream: ListStream, items: list[bytes], cache: ResponseCache, etag: str, extra: dict[str, Any]
+) -> AsyncIterator[bytes]:
+    """
+    Yield the list document batch by batch, starting with the batch already read
+    :param stream: Page to stream
+    :param items: First batch of serialized documents
+    :param cache: Cache to store the body in
+    :param etag: ETag to cache the body under
+    :param extra: Fields added to the list document after next_cursor
+    :return: Chunks of the JSON document
+    """
+    chunk = b'{"items":[' + b",".join(items)
+    chunks = [chunk]
+    body_size = len(chunk)
+    yield chunk
+
+    is_empty = not items
+    while items := await stream.read_batch():
+        chunk = b",".join(items)
+        if not is_empty:
+            chunk = b"," + chunk
+        is_empty = False
+
+        # Once the body outgrows the cache limit it is no longer kept.
+        body_size += len(chunk)
+        if body_size > settings.RESPONSE_CACHE_MAX_BODY_SIZE:
+            chunks = None
+        elif chunks is not None:
+            chunks.append(chunk)
+        yield chunk
+
+    chunk = b"]," + orjson.dumps({"next_cursor": stream.next_cursor, **extra})[1:]
+    yield chunk
+
+    if chunks is not None:
+        chunks.append(chunk)
+        cache.set(etag, b"".join(chunks))